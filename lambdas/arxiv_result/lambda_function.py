@@ -3,12 +3,35 @@ from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 import uuid
 import json
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
 from proozlshared.paper_retrieval import extract_papers, process_feed
+from proozlshared.query_index import canonical_query
 
 
 
 #leverage freezing
 TABLE = None
+LAMBDA_CLIENT = None
+#Batch workers outlive invocations, and since boto3 resources are not thread-safe
+#each worker thread keeps its own tables
+EXECUTOR = None
+WORKER_STATE = threading.local()
+
+MAX_RESULTS = 60
+#Batched events
+MAX_SPECS = 10
+MAX_WORKERS = 4
+#arXiv asks for 3 seconds between API calls
+ARXIV_INTERVAL = 3
+#Freshness, in seconds: past the soft TTL a cached page is served and revalidated in the background,
+#past the hard TTL it is refreshed before being served.  Revalidations of a page are at most one per window.
+SOFT_TTL = int(os.environ.get('PROOZL_SOFT_TTL', 24 * 60 * 60))
+HARD_TTL = int(os.environ.get('PROOZL_HARD_TTL', 14 * 24 * 60 * 60))
+REVALIDATE_WINDOW = int(os.environ.get('PROOZL_REVALIDATE_WINDOW', 15 * 60))
 
 
 def lambda_handler(event, context):
@@ -17,6 +40,15 @@ def lambda_handler(event, context):
     if TABLE is None:
         TABLE =  boto3.resource('dynamodb').Table('proozl-arxiv-search-results')
 
+    if 'revalidate' in event:
+        return revalidate(event['revalidate'], TABLE)
+
+    if 'specs' in event:
+        return {
+            'statusCode': 200,
+            'body': json.dumps(obtain_batch_results(event['specs'], TABLE))
+        }
+
     results = obtain_results(event, TABLE)
     if not results:
         return {
@@ -43,6 +75,7 @@ def obtain_results(event, table):
     1. Checks if the search results are already available in the table for 'query' and 'start'
             If results are found, the number of hits is updated and the results are returned.  
             If not, extracts the results using Arxiv API and inserts them in the table before returning
+    2. Found results are checked for freshness (see check_freshness) before being returned
     """
     query = event['query']
     start = event['start']
@@ -54,10 +87,10 @@ def obtain_results(event, table):
     else: 
         #Hit, return results
         content = cached['Items'][0]
-        id = content['id']
-        results = content['results']
-        update_hits(id, table)
-        return results
+        if check_freshness(content, table) == 'hard':
+            content = refresh_item(content, table)
+        update_hits(content['id'], table)
+        return content['results']
 
 def fresh_search(event, table):
     """
@@ -66,7 +99,7 @@ def fresh_search(event, table):
     1.  Collect the parameters
     2.  Send the parameters to extract_papers, which will grab the papers from Arxiv
     3.  Output is sent to process_feed to turn the search results into a json format
-    4.  If the search was successful, insert it into the table before returning.  
+    4.  If the search found any papers, insert it into the table before returning.  
         Table entries are structured:
         {
             'query_string': The string searched, which is the primary key
@@ -74,47 +107,347 @@ def fresh_search(event, table):
             'num_results': Total number of results found (NOT the same as event['max_results'])
             'num_of_hits_wk': Number of times the search has been conducted this week
             'num_of_hits_all': Number of times the search has happened across all time
+            'fetched_at': When the results were fetched from Arxiv, in epoch seconds
             'results': List of results themselves, which are a dict/map (see paper_retrieval.process_feed)
         }
-    5.  An unsuccessful search returns an empty string
+    5.  An unsuccessful search, or one without papers, returns an empty string and is not 
+        stored, the same as an 'empty' spec in obtain_batch_results
     """
     
     #Conduct Arxiv search
-    query = event['query'].lower()
+    query = canonical_query(event['query'])
     start = event['start']
-    max_results = 60
+
+    json_data = search_arxiv(query, start)
+    if json_data['results']:
+        #Data available, insert into table
+        table.put_item(Item=build_item(query, start, json_data))
+        return json_data['results']
+    #Otherwise return nothing
+    return ''
+
+
+def search_arxiv(query, start):
+    """Searches Arxiv for a page of query's results, returning the processed feed"""
     params = {
         'search_query': query,
         'start': start,
-        'max_results': max_results,
+        'max_results': MAX_RESULTS,
         'sortBy': 'lastUpdatedDate'
     }
-    
+    return process_feed(extract_papers(params))
 
-    json_data = process_feed(extract_papers(params))
-    if json_data:
-        #Data available, insert into table
 
-        table.put_item(
-            Item={
-                'id': json_data['id'],
-                'query_string': query,
-                'page_start': start,
-                'num_results': len(json_data['results']), 
-                'num_of_hits_wk': 1,
-                'num_of_hits_all': 1,
-                'results': json_data['results']
-            }
+def build_item(query, start, json_data):
+    """Builds a new table entry (see fresh_search) from the processed feed of a search"""
+    return {
+        'id': json_data['id'],
+        'query_string': query,
+        'page_start': start,
+        'num_results': len(json_data['results']), 
+        'num_of_hits_wk': 1,
+        'num_of_hits_all': 1,
+        'fetched_at': int(time.time()),
+        'results': json_data['results']
+    }
+
+
+def check_freshness(item, table):
+    """
+    Given an item from the table, compares its age against the TTLs and returns:
+    -'fresh' if it is younger than SOFT_TTL
+    -'soft' if it is younger than HARD_TTL, in which case a background revalidation is enqueued
+    -'hard' otherwise, and the caller is expected to refresh it before serving
+    Items from before fetched_at was recorded are treated as soft, so they are backfilled 
+    as they are requested rather than all at once.
+    Forced refreshes are claimed like revalidations (see claim_revalidation), so when arXiv 
+    fails or comes back empty, requests within REVALIDATE_WINDOW get 'soft' and are served 
+    the stale page instead of each waiting on arXiv again.
+    """
+    if 'fetched_at' not in item:
+        age = SOFT_TTL
+    else:
+        age = time.time() - int(item['fetched_at'])
+    if age < SOFT_TTL:
+        return 'fresh'
+    if age < HARD_TTL:
+        enqueue_revalidation(item, table)
+        return 'soft'
+    if claim_revalidation(item, table):
+        return 'hard'
+    return 'soft'
+
+
+def claim_revalidation(item, table):
+    """
+    Claims the item for a refresh by stamping revalidating_at, which only succeeds if no
+    other claim was made within REVALIDATE_WINDOW
+    """
+    now = int(time.time())
+    try:
+        table.update_item(
+            Key={'id': item['id']},
+            UpdateExpression="set revalidating_at = :now",
+            ConditionExpression="attribute_not_exists(revalidating_at) \
+                OR revalidating_at < :window_start",
+            ExpressionAttributeValues={
+                ':now': now,
+                ':window_start': now - REVALIDATE_WINDOW
+            },
+            ReturnValues="NONE"
         )
-        return json_data['results']
-    #Otherwise return nothing
-    return ''
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(e.response['Error']['Message'])
+        return False
+    return True
+
+
+def enqueue_revalidation(item, table):
+    """
+    Claims the item for revalidation (see claim_revalidation) and then invokes this function 
+    asynchronously with a revalidate event (see revalidate)
+    """
+    global LAMBDA_CLIENT
+    if not claim_revalidation(item, table):
+        return False
+
+    if LAMBDA_CLIENT is None:
+        LAMBDA_CLIENT = boto3.client('lambda')
+    try:
+        LAMBDA_CLIENT.invoke(
+            FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+            InvocationType='Event',
+            Payload=json.dumps({
+                'revalidate': {
+                    'id': item['id']
+                }
+            })
+        )
+    except (ClientError, KeyError) as e:
+        print('Could not enqueue revalidation for {0}: {1}'.format(item['id'], e))
+        return False
+    return True
+
+
+def revalidate(spec, table):
+    """
+    Handles a revalidate event, where spec has the structure:
+    {
+        'id': The id of the item to refresh
+    }
+    The event can come from any caller, so only the id is taken from it: the item is
+    read from the table and refreshed with its own query_string and page_start, and 
+    only if it is missing fetched_at or older than SOFT_TTL.
+    """
+    try:
+        found = table.get_item(Key={'id': str(spec['id'])})
+    except ClientError as e:
+        print(e.response['Error']['Message'])
+        found = {}
+    item = found.get('Item')
+    if not item:
+        return {
+            'statusCode': 200,
+            'body': 'No results found'
+        }
+    if 'fetched_at' in item and time.time() - int(item['fetched_at']) < SOFT_TTL:
+        return {
+            'statusCode': 200,
+            'body': 'Fresh'
+        }
+
+    refreshed = refresh_item(item, table)
+    return {
+        'statusCode': 200,
+        'body': 'Refreshed' if refreshed is not item else 'Not refreshed'
+    }
+
+
+def refresh_item(item, table):
+    """
+    Searches Arxiv again for the item's query and page, and updates the item in place with the 
+    new results and fetched_at, leaving its hit counts alone.  Returns the item with the new 
+    results, or the item unchanged if the search comes back empty or fails, or if the item 
+    no longer exists in the table.
+    """
+    try:
+        json_data = search_arxiv(item['query_string'], item['page_start'])
+    except Exception as e:
+        print('Refresh failed for {0}: {1}'.format(item['id'], e))
+        return item
+    if not json_data['results']:
+        return item
+
+    fetched_at = int(time.time())
+    try:
+        table.update_item(
+            Key={'id': item['id']},
+            UpdateExpression="set \
+                num_results = :num_results, \
+                results = :new_results, \
+                fetched_at = :fetched_at",
+            ConditionExpression="attribute_exists(id)",
+            ExpressionAttributeValues={
+                ':num_results': len(json_data['results']),
+                ':new_results': json_data['results'],
+                ':fetched_at': fetched_at
+            },
+            ReturnValues="NONE"
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(e.response['Error']['Message'])
+        return item
+    return dict(item, results=json_data['results'], fetched_at=fetched_at)
+
+
+def obtain_batch_results(specs, table):
+    """
+    Given a list of specs with the structure:
+    [
+        {
+            'query': The string to search for
+            'start': What page # of the paginated results to check
+        },
+        ...
+    ]
+    resolves all of them in one invocation and returns a list in the same order with the structure:
+    [
+        {
+            'query': The spec's query
+            'start': The spec's start
+            'status': 'hit' (served from the table), 'fetched' (fresh Arxiv search), 
+                'refreshed' (served from the table after a forced refresh, see check_freshness), 
+                'empty' (no results found), 'error' (the search failed), 
+                or 'skipped' (the spec is past the first MAX_SPECS and was not resolved)
+            'results': List of results, empty unless the status is 'hit', 'fetched' or 'refreshed'
+        },
+        ...
+    ]
+    1.  The table is searched for every distinct spec concurrently
+    2.  Misses are searched on Arxiv concurrently, with calls spaced by ARXIV_INTERVAL
+    3.  New pages are inserted together with a batch writer
+    4.  Hits are added up per item, so each item's hit counts are updated once
+    Hits past the soft TTL are revalidated in the background, and hits past the hard TTL
+    are refreshed alongside the misses.
+    """
+    skipped = specs[MAX_SPECS:]
+    specs = specs[:MAX_SPECS]
+    keys = [(canonical_query(spec['query']), spec['start']) for spec in specs]
+    distinct = list(dict.fromkeys(keys))
+
+    pool = get_executor()
+    def lookup(key):
+        return find_in_table(key[0], key[1], worker_table(table))
+    cached = dict(zip(distinct, pool.map(lookup, distinct)))
+
+    outcomes = {}
+    misses = []
+    stale = {}
+    for key in distinct:
+        found = cached[key]
+        if not found or found['Count'] == 0:
+            misses.append(key)
+        elif check_freshness(found['Items'][0], table) == 'hard':
+            stale[key] = found['Items'][0]
+        else:
+            outcomes[key] = ('hit', found['Items'][0])
+
+    limiter = RateLimiter(ARXIV_INTERVAL)
+    def fetch(key):
+        limiter.wait()
+        try:
+            return search_arxiv(*key)
+        except Exception as e:
+            print('Search failed for {0}: {1}'.format(key, e))
+            return None
+    def refresh(key):
+        limiter.wait()
+        return refresh_item(stale[key], worker_table(table))
+    fetch_results = pool.map(fetch, misses)
+    refresh_results = pool.map(refresh, stale)
+    fetched = dict(zip(misses, fetch_results))
+    refreshed = dict(zip(stale, refresh_results))
+    for key, item in refreshed.items():
+        outcomes[key] = ('refreshed' if item is not stale[key] else 'hit', item)
+
+    with table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+        for key, json_data in fetched.items():
+            if json_data is None:
+                outcomes[key] = ('error', None)
+            elif not json_data['results']:
+                outcomes[key] = ('empty', None)
+            else:
+                item = build_item(key[0], key[1], json_data)
+                batch.put_item(Item=item)
+                outcomes[key] = ('fetched', item)
+
+    #Repeats of a fetched spec count as hits on the new item
+    hits = Counter(
+        outcomes[key][1]['id'] for i, key in enumerate(keys)
+        if outcomes[key][0] in ['hit', 'refreshed'] or (outcomes[key][0] == 'fetched' and key in keys[:i])
+    )
+    for id, count in hits.items():
+        update_hits(id, table, count)
+
+    batch_results = []
+    for spec, key in zip(specs, keys):
+        status, item = outcomes[key]
+        batch_results.append({
+            'query': spec['query'],
+            'start': spec['start'],
+            'status': status,
+            'results': item['results'] if item else []
+        })
+    for spec in skipped:
+        batch_results.append({
+            'query': spec.get('query'),
+            'start': spec.get('start'),
+            'status': 'skipped',
+            'results': []
+        })
+    return batch_results
+
+
+def get_executor():
+    """Creates the batch workers once per container, so their tables are reused while warm"""
+    global EXECUTOR
+    if EXECUTOR is None:
+        EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    return EXECUTOR
+
+
+def worker_table(table):
+    """Returns a Table resource for table's name that belongs to the calling thread"""
+    tables = getattr(WORKER_STATE, 'tables', None)
+    if tables is None:
+        tables = WORKER_STATE.tables = {}
+    if table.name not in tables:
+        tables[table.name] = boto3.session.Session().resource('dynamodb').Table(table.name)
+    return tables[table.name]
+
+
+class RateLimiter:
+    '''Spaces calls to wait() across threads by at least interval seconds'''
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_call = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = max(0, self.next_call - now)
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay:
+            time.sleep(delay)
 
 
-def update_hits(id, table):
+def update_hits(id, table, count=1):
     """
     Updates the table using the id primary index to increase
-    [num_of_hits_wk, num_of_hits_all] by 1
+    [num_of_hits_wk, num_of_hits_all] by count
     """
     try:
         table.update_item(
@@ -123,7 +456,7 @@ def update_hits(id, table):
                 num_of_hits_wk = num_of_hits_wk + :val, \
                 num_of_hits_all = num_of_hits_all + :val",
             ExpressionAttributeValues={
-                ':val': 1
+                ':val': count
             },
             ReturnValues="NONE"
         )
@@ -139,7 +472,7 @@ def find_in_table(query, start, table):
             KeyConditionExpression="query_string = :query_val \
                 AND page_start = :start_val",
             ExpressionAttributeValues={
-                ':query_val': query.lower(),
+                ':query_val': canonical_query(query),
                 ':start_val': start
             }
         )
@@ -11,18 +11,40 @@ nltk_setup.get_nltk_data(NLTK_DATA_NEEDS)
 
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
-from nltk.tag import pos_tag
+from nltk.tag.perceptron import PerceptronTagger
 from collections import defaultdict
+import os
 
-def rank_results(results, query):
+#Tagging modes:
+#   'perceptron': every token is tagged by nltk's averaged perceptron
+#   'fast': proper nouns are decided by lexicon lookups and capitalization heuristics,
+#       falling back to the perceptron only for sentences with ambiguous tokens
+TAGGING_MODES = ['perceptron', 'fast']
+TAGGING_MODE = os.environ.get('PROOZL_TAGGING_MODE', 'perceptron')
+PROPER_NOUN_TAGS = ['NNP', 'NNPS']
+TAG_CACHE_LIMIT = 50000
+
+#leverage freezing
+TAGGER = None
+TAG_CACHE = {}
+
+def rank_results(results, query, mode=None):
     """
     Given a set of Arxiv results which contain paper abstracts and a query,
     finds these rankings using nltk:
     
     1.  The top ten mentioned proper nouns
     2.  The top ten mentioned words that are not part of the original query
+
+    The mode picks how tokens are tagged (see TAGGING_MODES), defaulting to TAGGING_MODE
     """
-    result_tokens = tokenize_abstracts(results);
+    mode = mode or TAGGING_MODE
+    if mode not in TAGGING_MODES:
+        raise ValueError('Unknown tagging mode: {0}'.format(mode))
+    if mode == 'fast':
+        result_tokens = fast_tokenize_abstracts(results)
+    else:
+        result_tokens = tokenize_abstracts(results)
     clean_toks = clean_tokens(result_tokens, query)
 
     ranks = {
@@ -36,13 +58,91 @@ def tokenize_abstracts(entries):
     Given a set of entries, tokenizes and assigns tags to all of the words across 
     all of the abstracts 
     """
+    tagger = get_tagger()
     result_tokens = []
     for entry in entries:
         tokens = nltk.word_tokenize(entry['summary'])
-        tokens = pos_tag(tokens)
+        tokens = tagger.tag(tokens)
         result_tokens.extend(tokens)
     return result_tokens
 
+def fast_tokenize_abstracts(entries):
+    """
+    Same output shape as tokenize_abstracts, but only the proper noun split is reliable:
+    tokens are tagged sentence by sentence with fast_tag_sentence, so anything that is not 
+    a proper noun carries its lexicon tag or a generic 'NN'
+    """
+    tagger = get_tagger()
+    result_tokens = []
+    for entry in entries:
+        for sentence in nltk.sent_tokenize(entry['summary']):
+            tokens = nltk.word_tokenize(sentence, preserve_line=True)
+            result_tokens.extend(fast_tag_sentence(tokens, tagger))
+    return result_tokens
+
+def fast_tag_sentence(tokens, tagger):
+    """
+    Given the tokens of a single sentence and a perceptron tagger, tags each token by:
+    1.  Looking up its tag in the memoized cache under the token's context shape
+    2.  Looking up the tagger's lexicon of unambiguous words
+    3.  Applying capitalization heuristics (see heuristic_tag)
+    If any token is still ambiguous, the perceptron tags the whole sentence once and 
+    the ambiguous tokens take its tags, which are cached for the next time the 
+    word shows up in the same context shape.
+    """
+    tags = []
+    ambiguous = []
+    for i, word in enumerate(tokens):
+        key = (word, context_shape(tokens, i))
+        tag = TAG_CACHE.get(key) or tagger.tagdict.get(word) or heuristic_tag(word, key[1])
+        if tag is None:
+            ambiguous.append(i)
+        tags.append(tag)
+    
+    if ambiguous:
+        full_tags = tagger.tag(tokens)
+        for i in ambiguous:
+            tag = full_tags[i][1]
+            tags[i] = tag
+            cache_tag((tokens[i], context_shape(tokens, i)), tag)
+    return list(zip(tokens, tags))
+
+def context_shape(tokens, i):
+    """
+    Summarizes the context of the token at index i as a tuple of:
+    (whether it starts the sentence, whether the previous token is capitalized)
+    """
+    if i == 0:
+        return (True, False)
+    return (False, tokens[i - 1][:1].isupper())
+
+def heuristic_tag(word, shape):
+    """
+    Decides the proper-noun-ness of a word that is not in the lexicon:
+    -Words without a leading capital are not proper nouns
+    -Capitalized words past the start of the sentence are proper nouns
+    -Capitalized words that start the sentence are ambiguous, so None is returned
+    Words that clean_tokens would filter out anyway are never worth a perceptron pass.
+    """
+    if not word[:1].isupper() or not word.isalnum() or len(word) <= 3:
+        return 'NN'
+    if not shape[0]:
+        return 'NNP'
+    return None
+
+def cache_tag(key, tag):
+    """Stores a perceptron-resolved tag, clearing the cache once it outgrows TAG_CACHE_LIMIT"""
+    if len(TAG_CACHE) >= TAG_CACHE_LIMIT:
+        TAG_CACHE.clear()
+    TAG_CACHE[key] = tag
+
+def get_tagger():
+    """Loads the perceptron tagger once per container; its tagdict doubles as the fast lexicon"""
+    global TAGGER
+    if TAGGER is None:
+        TAGGER = PerceptronTagger()
+    return TAGGER
+
 def clean_tokens(tokens, query):
     """
     Given a list of token words with their parts of speech, creates a dictionary with a structure:
@@ -87,7 +187,7 @@ def add_clean_token(clean_tokens, word, pos, stem=''):
     based on its part of speech and stem
     """
     
-    if pos == 'NNP' or pos == 'NNPS':
+    if pos in PROPER_NOUN_TAGS:
         clean_tokens['proper_nouns'].append(word)             
     else:
         clean_tokens['terms'][stem].append(word)       
@@ -5,6 +5,8 @@ import uuid
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 from lambdas.proozl_analyze.abstract_processing import rank_results
+from lambdas.proozl_analyze.result_analytics import facet_results
+from proozlshared.query_index import canonical_query
 
 class DecimalIntEncoder(json.JSONEncoder):
     '''Need custom encoder because DynamoDB stores numbers as Decimals'''
@@ -138,14 +140,15 @@ def analyze_results(spec, results_table):
     If no results are in the table that match the query, nothing is returned.
     Otherwise, the following analyses are done:
         -Word ranking data pulled from the abstracts
-        -...
+        -Category, co-author and timeline facets pulled from the papers' metadata
     '''
     analysis = {}
-    query = spec['query'].lower()
+    query = canonical_query(spec['query'])
     results = obtain_items(spec, results_table, 'results')
     if results:
         analysis = {
-            'word_rankings': rank_results(results, query)
+            'word_rankings': rank_results(results, query),
+            'facets': facet_results(results)
         }
     return analysis
 
@@ -156,7 +159,7 @@ def update_analysis(old_id, analysis, analysis_table):
     '''
     try:
         analysis_table.update_item(
-            Key={'id': id},
+            Key={'id': old_id},
             UpdateExpression="set \
                 analysis = :new_analysis",
             ExpressionAttributeValues={
@@ -177,7 +180,7 @@ def insert_analysis(spec, analysis, analysis_table):
     analysis_table.put_item(
         Item={
             'id': str(uuid.uuid4()),
-            'query_string': spec['query'].lower(),
+            'query_string': canonical_query(spec['query']),
             'page_start': spec['start'],
             'analysis': analysis
         }
@@ -214,7 +217,7 @@ def find_in_table(query, start, table):
             KeyConditionExpression="query_string = :query_val \
                 AND page_start = :start_val",
             ExpressionAttributeValues={
-                ':query_val': query.lower(),
+                ':query_val': canonical_query(query),
                 ':start_val': start
             }
         )
@@ -0,0 +1,104 @@
+import numpy as np
+
+TOP_CATEGORIES = 10
+TOP_PAIRS = 10
+#Papers from large collaborations can list hundreds of authors, which would make
+#the number of pairs explode, so only the first few are paired up
+MAX_PAIR_AUTHORS = 50
+
+def facet_results(results):
+    """
+    Given a set of Arxiv results, computes facets over the papers' metadata:
+    {
+        'categories': The top ten arXiv categories (tags) as [term, count],
+        'coauthors': The top ten pairs of authors that share papers as [author, author, count],
+        'timeline': {
+            'published': Number of papers published per month as [YYYY-MM, count],
+            'updated': Number of papers updated per month as [YYYY-MM, count]
+        }
+    }
+    """
+    columns = to_columns(results)
+    facets = {
+        'categories': get_category_histogram(columns['categories'], columns['category_names']),
+        'coauthors': get_coauthor_pairs(columns['authors'], columns['author_names']),
+        'timeline': {
+            'published': get_timeline(columns['published']),
+            'updated': get_timeline(columns['updated'])
+        }
+    }
+    return facets
+
+def to_columns(results):
+    """
+    Converts a list of papers into arrays:
+    -categories/authors: (paper index, code) pairs, with the names for each code in
+        category_names/author_names, sorted so that codes follow the alphabetical order
+    -published/updated: One datetime64 per dated paper, in seconds since the epoch
+    """
+    columns = {}
+    for facet, names_key, attribute, field, limit in [
+        ('categories', 'category_names', 'tags', 'term', None),
+        ('authors', 'author_names', 'authors', 'name', MAX_PAIR_AUTHORS)
+    ]:
+        paper_idx = []
+        names = []
+        for i, paper in enumerate(results):
+            entries = [e[field] for e in paper.get(attribute, []) if e.get(field)][:limit]
+            paper_idx.extend([i] * len(entries))
+            names.extend(entries)
+        unique_names, codes = np.unique(np.array(names, dtype=str), return_inverse=True)
+        columns[facet] = np.stack([np.array(paper_idx, dtype=np.int64), codes.astype(np.int64)])
+        columns[names_key] = unique_names
+
+    for attribute in ['published', 'updated']:
+        stamps = [paper[attribute][:19] for paper in results if paper.get(attribute)]
+        columns[attribute] = np.array(stamps, dtype='datetime64[s]')
+    return columns
+
+def get_category_histogram(categories, names):
+    """Counts the papers per category code and returns the top ten as [term, count]"""
+    counts = np.bincount(categories[1], minlength=len(names))
+    return top_counts(counts, [names], TOP_CATEGORIES)
+
+def get_coauthor_pairs(authors, names):
+    """
+    Given (paper index, author code) pairs grouped by paper, builds every pair of authors
+    within each paper without a per-paper loop:
+    for an author at position i of a paper's group ending at position end, the partners
+    are positions i+1 ... end-1, so each position is repeated (end - i - 1) times and
+    offset by 1, 2, ... to get its partners.
+    Returns the top ten pairs as [author, author, count]
+    """
+    papers, codes = authors
+    if len(codes) < 2:
+        return []
+    _, group_sizes = np.unique(papers, return_counts=True)
+    group_ends = np.repeat(np.cumsum(group_sizes), group_sizes)
+    positions = np.arange(len(codes))
+    num_partners = group_ends - positions - 1
+
+    left = np.repeat(positions, num_partners)
+    run_starts = np.repeat(np.cumsum(num_partners) - num_partners, num_partners)
+    right = left + 1 + np.arange(len(left)) - run_starts
+
+    first = np.minimum(codes[left], codes[right])
+    second = np.maximum(codes[left], codes[right])
+    distinct = first != second
+    pair_codes = first[distinct] * len(names) + second[distinct]
+    unique_pairs, counts = np.unique(pair_codes, return_counts=True)
+    return top_counts(counts, [names[unique_pairs // len(names)], names[unique_pairs % len(names)]], TOP_PAIRS)
+
+def get_timeline(stamps):
+    """Counts the timestamps per month, returning [YYYY-MM, count] in chronological order"""
+    months, counts = np.unique(stamps.astype('datetime64[M]'), return_counts=True)
+    return [[str(month), int(count)] for month, count in zip(months, counts)]
+
+def top_counts(counts, labels, k):
+    """
+    Given counts and lists of labels aligned with them (already in alphabetical order),
+    returns the k largest as [*labels, count], with ties broken by label order
+    """
+    order = np.lexsort((np.arange(len(counts)), -counts))
+    order = order[counts[order] > 0][:k]
+    return [[str(label[i]) for label in labels] + [int(counts[i])] for i in order]
@@ -0,0 +1,60 @@
+import boto3
+import json
+import os
+from botocore.exceptions import ClientError
+from proozlshared.query_index import load_index, INDEX_BUCKET, INDEX_KEY
+
+INDEX_PATH = os.path.join('/tmp', INDEX_KEY)
+DEFAULT_K = 5
+MAX_K = 20
+
+#leverage freezing
+INDEX = None
+
+
+def lambda_handler(event, context):
+
+    global INDEX
+    if INDEX is None:
+        INDEX = fetch_index()
+
+    suggestions = suggest(event, INDEX)
+    if not suggestions:
+        return {
+            'statusCode': 200,
+            'body': 'No suggestions found'
+        }
+    else:
+        return {
+            'statusCode': 200,
+            'body': json.dumps(suggestions)
+        }
+
+
+def suggest(event, index):
+    """
+    Given an event and a query index, where the event has the structure:
+    {
+        'prefix': What the user has typed so far
+        'k': The maximum number of suggestions to return (optional)
+    }
+    returns a list of [query, weight] for cached queries starting with prefix, 
+    most requested first
+    """
+    if index is None:
+        return []
+    k = min(int(event.get('k', DEFAULT_K)), MAX_K)
+    return index.complete(event.get('prefix', ''), k)
+
+
+def fetch_index():
+    """
+    Downloads the index that result-update builds into /tmp, and memory-maps it.
+    If there is no index yet, nothing is returned.
+    """
+    try:
+        boto3.client('s3').download_file(INDEX_BUCKET, INDEX_KEY, INDEX_PATH)
+    except ClientError as e:
+        print(e.response['Error']['Message'])
+        return None
+    return load_index(INDEX_PATH)
@@ -1,27 +1,42 @@
 import boto3
 from boto3.dynamodb.conditions import Key
+import os
 import time
+from collections import Counter
 from proozlshared.paper_retrieval import extract_papers, process_feed
+from proozlshared.query_index import build_index, query_weight, INDEX_BUCKET, INDEX_KEY
+
+#arxiv-result refreshes requested pages on demand once they are older than its soft TTL and
+#before serving them past this hard TTL (in seconds), so the sweep only refreshes pages that
+#have not been requested within it
+HARD_TTL = int(os.environ.get('PROOZL_HARD_TTL', 14 * 24 * 60 * 60))
 
 def lambda_handler(event, context):
 
     client = boto3.resource('dynamodb')
     table = client.Table('proozl-arxiv-search-results')
 
+    upload_index(index_queries(table))
     update_results(table)
     
 
 def update_results(table):
     '''
     Loops through each item in the table and updates it with a new search
-    using the parameters in the item
+    using the parameters in the item.  Items fetched within HARD_TTL only
+    have their weekly hits reset.
     '''
     results = table.scan()
     max_results = 60
     update_count = 0
     clear_count = 0
+    skip_count = 0
     while True:
         for item in results['Items']:
+            if time.time() - int(item.get('fetched_at', 0)) < HARD_TTL:
+                reset_weekly_hits(table, item['id'])
+                skip_count += 1
+                continue
             params = {
             'search_query': item['query_string'],
             'start': item['page_start'],
@@ -41,7 +56,41 @@ def update_results(table):
             break
         else:
             results = table.scan(ExclusiveStartKey = results['LastEvaluatedKey'])
-    print('Updated: {0}, Cleared: {1}'.format(update_count, clear_count))
+    print('Updated: {0}, Cleared: {1}, Fresh: {2}'.format(update_count, clear_count, skip_count))
+
+
+def index_queries(table):
+    '''
+    Scans the table for the hit weight of every query that has results, for the query index.
+    This is its own scan, run before update_results, rather than being gathered during the
+    sweep: the sweep calls Arxiv for each stale page and can time out or fail partway, and
+    the index should not depend on it finishing.  Running first also means the weights 
+    still include the weekly hits that the sweep resets.
+    '''
+    projection = {
+        'ProjectionExpression': 'query_string, num_results, num_of_hits_wk, num_of_hits_all'
+    }
+    results = table.scan(**projection)
+    weights = Counter()
+    while True:
+        for item in results['Items']:
+            if int(item.get('num_results', 0)) > 0:
+                weights[item['query_string']] += query_weight(item)
+        if 'LastEvaluatedKey' not in results:
+            break
+        else:
+            results = table.scan(ExclusiveStartKey = results['LastEvaluatedKey'], **projection)
+    return weights
+
+
+def upload_index(weights):
+    '''
+    Builds the query index from the weights gathered by index_queries
+    and replaces the copy that query-suggest loads
+    '''
+    blob = build_index(weights)
+    boto3.client('s3').put_object(Bucket=INDEX_BUCKET, Key=INDEX_KEY, Body=blob)
+    print('Indexed: {0} queries, {1} bytes'.format(len(weights), len(blob)))
     
 
 def update_item(table, id, json_data):
@@ -51,10 +100,12 @@ def update_item(table, id, json_data):
         UpdateExpression="set \
             num_results = :num_results, \
             results = :new_results, \
+            fetched_at = :fetched_at, \
             num_of_hits_wk = :weekly_reset",
         ExpressionAttributeValues={
             ':num_results': len(json_data['results']),
             ':new_results': json_data['results'],
+            ':fetched_at': int(time.time()),
             ':weekly_reset': 0
         },
         ReturnValues="NONE"
@@ -67,10 +118,23 @@ def clear_item(table, id):
         UpdateExpression="set \
             num_results = :num_results, \
             results = :new_results, \
+            fetched_at = :fetched_at, \
             num_of_hits_wk = 0",
         ExpressionAttributeValues={
             ':num_results': 0,
-            ':new_results': []
+            ':new_results': [],
+            ':fetched_at': int(time.time())
+        },
+        ReturnValues="NONE"
+    )
+
+def reset_weekly_hits(table, id):
+
+    table.update_item(
+        Key={'id': id},
+        UpdateExpression="set num_of_hits_wk = :weekly_reset",
+        ExpressionAttributeValues={
+            ':weekly_reset': 0
         },
         ReturnValues="NONE"
     )
\ No newline at end of file
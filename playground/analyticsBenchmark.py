@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import random
+from collections import Counter
+from itertools import combinations
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lambdas.proozl_analyze import result_analytics as ra
+
+
+BATCH_SIZES = [60, 600, 6000]
+ROUNDS = 3
+CATEGORIES = ['astro-ph.{0}'.format(c) for c in ['CO', 'GA', 'HE', 'SR', 'EP', 'IM']] + ['gr-qc', 'hep-th', 'hep-ph', 'quant-ph']
+
+
+def make_papers(n, seed=0):
+    """Builds n papers shaped like process_feed output, with a skewed pool of authors and categories"""
+    rng = random.Random(seed)
+    authors = ['Author {0}'.format(i) for i in range(n // 2 + 10)]
+    papers = []
+    for _ in range(n):
+        published = '20{0:02d}-{1:02d}-{2:02d}T12:00:00Z'.format(rng.randint(10, 20), rng.randint(1, 12), rng.randint(1, 28))
+        papers.append({
+            'tags': [{'term': t} for t in rng.sample(CATEGORIES, rng.randint(1, 3))],
+            'authors': [{'name': a} for a in set(rng.choices(authors[:rng.randint(5, len(authors))], k=rng.randint(1, 8)))],
+            'published': published,
+            'updated': published
+        })
+    return papers
+
+
+def naive_facets(results):
+    """The per-paper dict loop that facet_results replaces"""
+    categories = Counter()
+    pairs = Counter()
+    published = Counter()
+    updated = Counter()
+    for paper in results:
+        for tag in paper.get('tags', []):
+            if tag.get('term'):
+                categories[tag['term']] += 1
+        names = [a['name'] for a in paper.get('authors', []) if a.get('name')][:ra.MAX_PAIR_AUTHORS]
+        for a, b in combinations(names, 2):
+            if a != b:
+                pairs[(min(a, b), max(a, b))] += 1
+        if paper.get('published'):
+            published[paper['published'][:7]] += 1
+        if paper.get('updated'):
+            updated[paper['updated'][:7]] += 1
+    top = lambda counter, k: sorted(counter.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+    return {
+        'categories': [[c, n] for c, n in top(categories, ra.TOP_CATEGORIES)],
+        'coauthors': [[a, b, n] for (a, b), n in top(pairs, ra.TOP_PAIRS)],
+        'timeline': {
+            'published': [[m, n] for m, n in sorted(published.items())],
+            'updated': [[m, n] for m, n in sorted(updated.items())]
+        }
+    }
+
+
+def time_facets(facets, papers):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        output = facets(papers)
+    return ((time.perf_counter() - start) / ROUNDS, output)
+
+
+if __name__ == "__main__":
+
+    for n in BATCH_SIZES:
+        papers = make_papers(n)
+        naive_time, naive_output = time_facets(naive_facets, papers)
+        vector_time, vector_output = time_facets(ra.facet_results, papers)
+        print('{0:>6} papers: naive {1:.4f}s, vectorized {2:.4f}s ({3:.1f}x), outputs match: {4}'.format(
+            n, naive_time, vector_time, naive_time / vector_time, naive_output == vector_output))
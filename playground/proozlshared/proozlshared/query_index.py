@@ -0,0 +1,109 @@
+import mmap
+import struct
+import numpy as np
+
+INDEX_BUCKET = 'proozl-query-index'
+INDEX_KEY = 'query-index.bin'
+#Weekly hits count this many times more than all-time hits, so current interest ranks first
+WEEKLY_BOOST = 4
+
+#Blob layout, little endian:
+#   header: magic, number of queries n
+#   offsets: n + 1 uint32, where query i is data[offsets[i]:offsets[i + 1]]
+#   weights: n uint32
+#   data: the utf-8 queries, sorted bytewise and concatenated
+MAGIC = b'PZQ1'
+HEADER = struct.Struct('<4sI')
+
+
+def canonical_query(query):
+    """
+    Lowercases a query and collapses its whitespace.  Queries are stored in and looked up 
+    from the results and analyses tables in this form, so suggestions always match the cache.
+    """
+    return ' '.join(query.lower().split())
+
+def query_weight(item):
+    """ Weighs an item of the results table by its hits, see WEEKLY_BOOST """
+    return int(item.get('num_of_hits_all', 0)) + WEEKLY_BOOST * int(item.get('num_of_hits_wk', 0))
+
+def build_index(weights):
+    """
+    Given a dictionary of {query: weight}, builds the blob read by QueryIndex.
+    Queries are canonicalized first, so weights of variants are added together.
+    """
+    merged = {}
+    for query, weight in weights.items():
+        key = canonical_query(query).encode('utf-8')
+        if key:
+            merged[key] = merged.get(key, 0) + int(weight)
+    keys = sorted(merged)
+    offsets = np.zeros(len(keys) + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(k) for k in keys])
+    counts = np.array([min(merged[k], 0xFFFFFFFF) for k in keys], dtype='<u4')
+    return b''.join([HEADER.pack(MAGIC, len(keys)), offsets.tobytes(), counts.tobytes()] + keys)
+
+def load_index(path):
+    """ Memory-maps a blob written by build_index into a QueryIndex """
+    with open(path, 'rb') as blob:
+        return QueryIndex(mmap.mmap(blob.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class QueryIndex:
+    '''
+    Answers top-k completions over a blob from build_index without copying it:
+    the prefix's range of queries is found by binary search, and the range's weights
+    are ranked with numpy.
+    '''
+    def __init__(self, buffer):
+        magic, size = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a query index')
+        self.size = size
+        self.buffer = buffer
+        self.offsets = np.frombuffer(buffer, dtype='<u4', count=size + 1, offset=HEADER.size)
+        self.weights = np.frombuffer(buffer, dtype='<u4', count=size, offset=HEADER.size + 4 * (size + 1))
+        self.data_start = HEADER.size + 8 * size + 4
+
+    def __len__(self):
+        return self.size
+
+    def query_at(self, i):
+        return self.buffer[self.data_start + self.offsets[i]:self.data_start + self.offsets[i + 1]]
+
+    def lower_bound(self, key):
+        """ Index of the first query that sorts at or after key """
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.query_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def complete(self, prefix, k=5):
+        """
+        Returns up to k [query, weight] that start with prefix, heaviest first,
+        with ties in alphabetical order
+        """
+        key = canonical_query(prefix).encode('utf-8')
+        if prefix[-1:].isspace() and key:
+            key += b' '
+        lo = self.lower_bound(key)
+        #No utf-8 byte is 0xff, so this sorts after every query starting with key
+        hi = self.lower_bound(key + b'\xff')
+        if lo >= hi or k <= 0:
+            return []
+
+        weights = self.weights[lo:hi]
+        if len(weights) > k:
+            #Everything heavier than the k-th weight, topped up with the first queries tied with it
+            kth = np.partition(weights, len(weights) - k)[len(weights) - k]
+            heavier = np.flatnonzero(weights > kth)
+            tied = np.flatnonzero(weights == kth)[:k - len(heavier)]
+            candidates = np.concatenate([heavier, tied])
+        else:
+            candidates = np.arange(len(weights))
+        order = candidates[np.lexsort((candidates, -weights[candidates].astype(np.int64)))]
+        return [[self.query_at(lo + i).decode('utf-8'), int(weights[i])] for i in order]
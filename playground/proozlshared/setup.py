@@ -10,6 +10,7 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     install_requires=[
         'nltk', 
+        'numpy',
         'requests', 
         'feedparser'],
     classifiers=[
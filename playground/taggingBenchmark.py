@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lambdas.proozl_analyze import abstract_processing as ap
+
+
+ROUNDS = 5
+
+
+def load_entries(path):
+    """Loads recorded abstracts, renaming 'abstract' to the 'summary' key the lambda expects"""
+    with open(path) as results:
+        data = json.loads(results.read())
+    return [{'summary': entry.get('summary', entry.get('abstract', ''))} for entry in data]
+
+
+class CountingTagger:
+    '''Wraps the perceptron tagger to count the sentences the fast mode falls back on it for'''
+    def __init__(self, tagger):
+        self.tagger = tagger
+        self.tagdict = tagger.tagdict
+        self.calls = 0
+
+    def tag(self, tokens):
+        self.calls += 1
+        return self.tagger.tag(tokens)
+
+
+def time_mode(entries, tokenize, reset=None):
+    """
+    Runs tokenize over the entries ROUNDS times, calling reset (if given) before every round
+    outside of the timing, and returns (tokens per second, last output)
+    """
+    tokens = []
+    elapsed = 0
+    for _ in range(ROUNDS):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        tokens = tokenize(entries)
+        elapsed += time.perf_counter() - start
+    return (len(tokens) * ROUNDS / elapsed, tokens)
+
+
+def proper_nouns(tokens):
+    return [w for (w, pos) in tokens if pos in ap.PROPER_NOUN_TAGS]
+
+
+def compare(perceptron_tokens, fast_tokens):
+    """
+    Measures agreement on the proper noun split, which is all add_clean_token uses:
+    -token: fraction of tokens where both modes agree on proper-noun-ness
+    -pn10: overlap of the top ten proper nouns
+    """
+    pairs = list(zip(perceptron_tokens, fast_tokens))
+    agree = sum(1 for ((w, p), (_, f)) in pairs
+        if (p in ap.PROPER_NOUN_TAGS) == (f in ap.PROPER_NOUN_TAGS))
+    p10 = set(w for w, _ in ap.get_pn10(proper_nouns(perceptron_tokens)))
+    f10 = set(w for w, _ in ap.get_pn10(proper_nouns(fast_tokens)))
+    return {
+        'token': agree / len(pairs) if pairs else 1.0,
+        'pn10': len(p10 & f10) / len(p10) if p10 else 1.0
+    }
+
+
+if __name__ == "__main__":
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), 'results.json')
+    entries = load_entries(path)
+    #Both modes share the tagger, so load it before timing either of them
+    ap.get_tagger()
+
+    perceptron_rate, perceptron_tokens = time_mode(entries, ap.tokenize_abstracts)
+
+    #Cold: every round starts with an empty cache, like a fresh container
+    ap.TAGGER = CountingTagger(ap.get_tagger())
+    fast_rate, fast_tokens = time_mode(entries, ap.fast_tokenize_abstracts, ap.TAG_CACHE.clear)
+    cold_fallbacks = ap.TAGGER.calls / ROUNDS
+    #Warm: the cache carries over from the cold rounds, like a warm container seeing similar abstracts
+    ap.TAGGER.calls = 0
+    warm_rate, _ = time_mode(entries, ap.fast_tokenize_abstracts)
+    warm_fallbacks = ap.TAGGER.calls / ROUNDS
+    sentences = sum(len(ap.nltk.sent_tokenize(entry['summary'])) for entry in entries)
+
+    if len(perceptron_tokens) != len(fast_tokens):
+        print('Warning: token counts differ ({0} vs {1})'.format(len(perceptron_tokens), len(fast_tokens)))
+    agreement = compare(perceptron_tokens, fast_tokens)
+    print('perceptron: {0:.0f} tokens/s'.format(perceptron_rate))
+    print('fast, cold: {0:.0f} tokens/s ({1:.1f}x), {2:.0f}/{3} sentences fell back to the perceptron'.format(
+        fast_rate, fast_rate / perceptron_rate, cold_fallbacks, sentences))
+    print('fast, warm: {0:.0f} tokens/s ({1:.1f}x), {2:.0f}/{3} sentences fell back to the perceptron'.format(
+        warm_rate, warm_rate / perceptron_rate, warm_fallbacks, sentences))
+    print('proper noun agreement: {0:.2%} of tokens, {1:.0%} of pn10'.format(agreement['token'], agreement['pn10']))